@@ -18,9 +18,13 @@ class MUA:
     def run(self):
         self.msgs = MsgList(self.mdb)
 
-        with self.term.program_mode(altscreen=self.args.altscreen) as region:
-            index_mode = IndexMode(region, self.mdb, self.msgs)
-            try:
-                index_mode.run()
-            except QuitError:
-                return
+        altscreen = self.args.altscreen
+        try:
+            with self.term.program_mode(altscreen=altscreen) as region:
+                index_mode = IndexMode(region, self.mdb, self.msgs)
+                try:
+                    index_mode.run()
+                except QuitError:
+                    return
+        finally:
+            self.term.close()
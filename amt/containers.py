@@ -7,34 +7,32 @@ import weakref
 
 class WeakrefSet:
     def __init__(self):
+        # Maps id(item) --> weakref to item.  An id cannot be reused until
+        # its object has been destroyed, and the weakref callback removes the
+        # entry at that point.
         self.__items = {}
 
     def add(self, item):
         assert item is not None
+        item_id = id(item)
 
         def _item_destroyed(ref):
-            del self.__items[ref_id]
+            if self.__items.get(item_id) is ref:
+                del self.__items[item_id]
 
-        ref = weakref.ref(item, _item_destroyed)
-        ref_id = id(ref)
-        self.__items[ref_id] = ref
+        self.__items[item_id] = weakref.ref(item, _item_destroyed)
 
     def remove(self, item):
         '''
         Remove an item from the container.
-
-        Note that this is O(n) at the moment.  (This is fixable by adding
-        a second index, but probably not worth the effort at the moment,
-        since WeakrefSet is only used for very small lists.)
         '''
         assert item is not None
 
-        for ref in self.__items.values():
-            if item == ref():
-                ref_id = id(ref)
-                del self.__items[ref_id]
-                return
-        raise KeyError('no such item in the container')
+        item_id = id(item)
+        ref = self.__items.get(item_id)
+        if ref is None or ref() is not item:
+            raise KeyError('no such item in the container')
+        del self.__items[item_id]
 
     def __iter__(self):
         # Copy the values in case they change while we are iterating
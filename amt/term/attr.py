@@ -32,6 +32,12 @@ class Attributes:
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def key(self):
+        '''
+        Return a hashable value that compares equal for equal Attributes.
+        '''
+        return (self.attrs, self.fg.value, self.bg.value)
+
     def modify(self, modifier):
         new = self.copy()
         new.modify_in_place(modifier)
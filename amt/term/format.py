@@ -121,15 +121,20 @@ conjunction with terminal attributes:
   format('Left{=min=4,default=8:underline,bg=blue}Right')
 '''
 
-import math
+import copy
+import functools
 import re
 import string
+import weakref
 
 from .attr import *
 from . import unicode
 
 
 class LineSegment:
+    __slots__ = ('attr_modifier', 'permanent_attr', 'min_width', 'max_width',
+                 'pad_precedence', 'pad_weight')
+
     def __init__(self):
         # Required attributes of all LineSegment objects
         self.attr_modifier = None
@@ -174,9 +179,12 @@ class LineSegment:
 
 
 class TextSegment(LineSegment):
+    __slots__ = ('value', 'rendered_width', '_truncated')
+
     def __init__(self, value, min_width=None, pad_weight=None):
         super(TextSegment, self).__init__()
         self.value, self.rendered_width = unicode.renderable_line(value)
+        self._truncated = None
         self.min_width = self.rendered_width
         self.max_width = self.rendered_width
 
@@ -191,7 +199,7 @@ class TextSegment(LineSegment):
         # precedence of 0, so they will fully expand before normal padding
         # fields start expanding.)
         if min_width is not None:
-            self.min_width = max(min(min_width, width), 0)
+            self.min_width = max(min(min_width, self.rendered_width), 0)
             if pad_weight is None:
                 self.pad_weight = 1
             else:
@@ -203,10 +211,20 @@ class TextSegment(LineSegment):
     def get_value(self, width):
         if width >= self.rendered_width:
             return self.value, self.rendered_width
-        return unicode.renderable_line(self.value, max_width=width)
+
+        # Lines tend to be re-rendered at the same width, so remember the
+        # most recent truncated value.
+        truncated = self._truncated
+        if truncated is not None and truncated[0] == width:
+            return truncated[1]
+        result = unicode.renderable_line(self.value, max_width=width)
+        self._truncated = (width, result)
+        return result
 
 
 class PaddingSegment(LineSegment):
+    __slots__ = ('value', 'value_width', 'default_width')
+
     def __init__(self, value=None, min_width=1, default_width=4,
                  max_width=None, pad_weight=1, precedence=1):
         super(PaddingSegment, self).__init__()
@@ -228,42 +246,194 @@ class PaddingSegment(LineSegment):
     def get_value(self, width):
         if self.value_width == 1:
             # common case
+            buf = _padding_buffer(self.value)
+            if width <= len(buf):
+                return buf[:width], width
             return self.value * width, width
 
-        num_repititions = width / self.value_width
-        if int(num_repititions) == num_repititions:
-            return self.value * int(num_repititions)
-        line = self.value * (1 + int(num_repititions))
-        return unicode.renderable_line(line, width)
+        num_repetitions, remainder = divmod(width, self.value_width)
+        if remainder == 0:
+            return self.value * num_repetitions, width
+        line = self.value * (1 + num_repetitions)
+        return unicode.renderable_line(line, max_width=width)
+
+
+_PADDING_BUFFER_LEN = 512
+
+
+@functools.lru_cache(maxsize=32)
+def _padding_buffer(value):
+    '''
+    Return a long string of repeated single-cell padding characters.
+
+    Padding values are sliced out of this, rather than building a new
+    repeated string each time a padding segment is rendered.
+    '''
+    return value * _PADDING_BUFFER_LEN
+
+
+def _iter_list(value, sep=','):
+    '''
+    Iterate over the sep-separated items in value.
+
+    This behaves like iterating over value.split(sep), but scans the string
+    in place rather than building an intermediate list.
+    '''
+    start = 0
+    while True:
+        idx = value.find(sep, start)
+        if idx < 0:
+            yield value[start:]
+            return
+        yield value[start:idx]
+        start = idx + 1
+
+
+def _iter_params(value, sep=',', eq='='):
+    '''
+    Iterate over a list of name=value parameters in a single pass.
+
+    Yields (name, value) tuples.  value is None for parameters that do not
+    contain an eq character.
+    '''
+    start = 0
+    end = len(value)
+    while start <= end:
+        param_end = value.find(sep, start)
+        if param_end < 0:
+            param_end = end
+        eq_idx = value.find(eq, start, param_end)
+        if eq_idx < 0:
+            yield value[start:param_end], None
+        else:
+            yield value[start:eq_idx], value[eq_idx + 1:param_end]
+        start = param_end + 1
+
+
+@functools.lru_cache(maxsize=1024)
+def _shared_text_segment(value):
+    '''
+    Return a TextSegment for the specified literal text.
+
+    The returned segment is shared with other callers, so it must not be
+    modified.  Use copy.copy() on the result if you need to change its
+    attributes.
+    '''
+    return TextSegment(value)
+
+
+class _PaddingLevel:
+    '''
+    The expandable segments of a TextLine that share a padding precedence.
+
+    The segment weights and maximum widths are stored in flat lists, so that
+    allocate() can do its arithmetic without looking up segment attributes.
+    '''
+    __slots__ = ('total_weight', 'indices', 'weights', 'max_widths')
+
+    def __init__(self):
+        self.total_weight = 0
+        self.indices = []
+        self.weights = []
+        self.max_widths = []
+
+    def add_segment(self, idx, segment):
+        self.total_weight += segment.pad_weight
+        self.indices.append(idx)
+        self.weights.append(segment.pad_weight)
+        self.max_widths.append(segment.max_width)
+
+    def allocate(self, widths, len_left):
+        '''
+        Distribute up to len_left extra cells among the segments at this
+        level, in proportion to their weights.  widths is updated in place.
+
+        Returns the number of cells that could not be allocated because every
+        segment reached its maximum width.
+        '''
+        indices = self.indices
+        weights = self.weights
+        max_widths = self.max_widths
+
+        # Hand out the space left in proportion to the segment weights.
+        # If this pass leaves space over, it is only because some segments
+        # hit their maximum width.  Those segments drop out, and the
+        # remaining space is shared among the rest.
+        active = range(len(indices))
+        active_weight = self.total_weight
+        while len_left > 0 and active:
+            weight_left = active_weight
+            unclamped = []
+            for n in active:
+                weight = weights[n]
+                # Integer ceiling of weight * len_left / weight_left
+                extra = -(-weight * len_left // weight_left)
+                weight_left -= weight
+
+                idx = indices[n]
+                cur_width = widths[idx]
+                new_width = cur_width + extra
+                max_width = max_widths[n]
+                if max_width is not None and new_width >= max_width:
+                    new_width = max_width
+                    active_weight -= weight
+                else:
+                    unclamped.append(n)
+                widths[idx] = new_width
+                len_left -= new_width - cur_width
+                assert len_left >= 0
+            active = unclamped
+        return len_left
 
 
 class TextLine:
     def __init__(self):
         self.segments = []
 
+        # The segment minimum widths and their total, and the segments that
+        # are able to expand past their minimum width.  These are maintained
+        # by add_segment(), so render() doesn't have to recompute them.
+        #
+        # pad_levels maps each padding precedence to a _PaddingLevel, and
+        # sorted_pad_levels lists the levels in order of precedence.
+        self.min_widths = []
+        self.min_width = 0
+        self.pad_levels = {}
+        self.sorted_pad_levels = []
+
+    def add_segment(self, segment):
+        idx = len(self.segments)
+        self.segments.append(segment)
+        self.min_widths.append(segment.min_width)
+        self.min_width += segment.min_width
+        if not segment.pad_weight:
+            return
+
+        level = self.pad_levels.get(segment.pad_precedence)
+        if level is None:
+            level = _PaddingLevel()
+            self.pad_levels[segment.pad_precedence] = level
+            self.sorted_pad_levels = [
+                self.pad_levels[precedence]
+                for precedence in sorted(self.pad_levels)]
+        level.add_segment(idx, segment)
+
     def render(self, term, width):
         # If we don't have a line width, use the default widths
         if width is None:
             return self._render(term, self.get_default_widths())
 
-        # Compute the length if we just used the minimum widths
-        min_width = 0
-        pad_weights = {}
-        widths = [0] * len(self.segments)
-        for idx, segment in enumerate(self.segments):
-            widths[idx] = segment.min_width
-            min_width += segment.min_width
-            if min_width >= width:
-                # The line doesn't fit.  Render as much as we can
-                # using the minimum widths.
-                return self._render(term, self.get_min_widths(width))
-
-            pad_weights.setdefault(segment.pad_precedence, 0)
-            pad_weights[segment.pad_precedence] += segment.pad_weight
+        min_width = self.min_width
+        if min_width >= width or not self.pad_levels:
+            # Either the line doesn't fit, in which case we render as much as
+            # we can using the minimum widths, or no segment is able to
+            # expand, so the minimum widths are all we will use anyway.
+            return self._render(term, self.get_min_widths(width))
 
         # We have room left over after the minimum widths.
         # Compute how much extra space should be allocated to each segment,
         # based on their weights.
+        widths = list(self.min_widths)
         len_left = width - min_width
         # Different segments may have different padding precedences.
         # This allows text segments to fully expand before we start inserting
@@ -271,31 +441,8 @@ class TextLine:
         #
         # Iterate through each precedence level, and allocate as much padding
         # as possible to each level before preceding to the next level.
-        sorted_weights = sorted(pad_weights.items(), key=lambda x: x[0])
-        for precedence, total_weight in sorted_weights:
-            while len_left > 0:
-                padding_allocated = 0
-                weight_left = total_weight
-                for idx, segment in enumerate(self.segments):
-                    if weight_left <= 0:
-                        break
-                    extra = math.ceil(segment.pad_weight *
-                                      float(len_left) / weight_left)
-                    cur_width = widths[idx]
-                    new_width = cur_width + extra
-                    if segment.max_width is not None:
-                        new_width = min(segment.max_width, new_width)
-                        extra = new_width - cur_width
-                    widths[idx] = new_width
-
-                    weight_left -= segment.pad_weight
-                    assert weight_left >= 0
-                    len_left -= extra
-                    assert len_left >= 0
-                    padding_allocated += extra
-
-                if padding_allocated == 0:
-                    break
+        for level in self.sorted_pad_levels:
+            len_left = level.allocate(widths, len_left)
             if len_left == 0:
                 break
 
@@ -303,34 +450,71 @@ class TextLine:
         return self._render(term, pieces)
 
     def _render(self, term, pieces):
-        outputs = []
-        cur_attr = term.default_attr
-        last_attr = term.default_attr
-        attr_stack = []
+        '''
+        Render the line.
 
-        for segment, value in pieces:
-            if segment.attr_modifier is None:
+        pieces is an iterable of (attr_modifier, permanent_attr, value)
+        tuples, as generated by get_default_widths(), get_min_widths() or
+        get_pad_widths().
+        '''
+        outputs = []
+        append = outputs.append
+        default_attr = term.default_attr
+        cur_attr = default_attr
+        last_attr = default_attr
+        attr_changed = False
+        # Cache of (id(cur_attr), id(modifier)) --> modified attributes.
+        # The cache holds references to every Attributes object that can be
+        # cur_attr, so the ids remain valid for the duration of the render.
+        modified_attrs = {}
+        esc_cache = _get_esc_cache(term)
+
+        for modifier, permanent_attr, value in pieces:
+            if modifier is None:
                 new_attr = cur_attr
             else:
-                new_attr = cur_attr.modify(segment.attr_modifier)
-
-            if new_attr != last_attr:
-                outputs.append(last_attr.change_esc(new_attr, term))
+                key = (id(cur_attr), id(modifier))
+                new_attr = modified_attrs.get(key)
+                if new_attr is None:
+                    new_attr = cur_attr.modify(modifier)
+                    modified_attrs[key] = new_attr
+
+            # new_attr is usually the same object as last_attr (segments
+            # without a modifier, or a modifier we have already applied),
+            # so check identity before doing a full comparison.
+            if new_attr is not last_attr and new_attr != last_attr:
+                esc_key = (last_attr.key(), new_attr.key())
+                esc = esc_cache.get(esc_key)
+                if esc is None:
+                    esc = last_attr.change_esc(new_attr, term)
+                    esc_cache[esc_key] = esc
+                append(esc)
                 last_attr = new_attr
-            if segment.permanent_attr:
+                attr_changed = True
+            if permanent_attr:
                 cur_attr = new_attr
 
-            outputs.append(value)
-
-        if last_attr != term.default_attr:
-            outputs.append(last_attr.change_esc(term.default_attr, term))
+            # '+' fields and zero-width padding render as empty strings;
+            # there's no need to hand those to join().
+            if value:
+                append(value)
+
+        # If we never changed the attributes, last_attr is still the default
+        # and there is nothing to reset.
+        if attr_changed and last_attr != default_attr:
+            esc_key = (last_attr.key(), default_attr.key())
+            esc = esc_cache.get(esc_key)
+            if esc is None:
+                esc = last_attr.change_esc(default_attr, term)
+                esc_cache[esc_key] = esc
+            append(esc)
 
         return ''.join(outputs)
 
     def get_default_widths(self):
         for segment in self.segments:
             value, width = segment.get_value_default_width()
-            yield segment, value
+            yield segment.attr_modifier, segment.permanent_attr, value
 
     def get_min_widths(self, width):
         width_left = width
@@ -340,14 +524,33 @@ class TextLine:
             width_left -= value_width
             assert width_left >= 0
 
-            yield segment, value
+            yield segment.attr_modifier, segment.permanent_attr, value
             if width_left <= 0:
                 return
 
     def get_pad_widths(self, widths):
         for segment, width in zip(self.segments, widths):
             value, actual_width = segment.get_value(width)
-            yield segment, value
+            yield segment.attr_modifier, segment.permanent_attr, value
+
+
+# Maps each terminal to a dictionary of
+# (old attributes key, new attributes key) --> escape sequence
+_esc_caches = weakref.WeakKeyDictionary()
+
+
+def _get_esc_cache(term):
+    '''
+    Get the cache of attribute change escape sequences for a terminal.
+
+    The same few attribute transitions tend to occur over and over, so this
+    saves having to look up the terminal capabilities every time.
+    '''
+    cache = _esc_caches.get(term)
+    if cache is None:
+        cache = {}
+        _esc_caches[term] = cache
+    return cache
 
 
 def format(term, fmt, *args, **kwargs):
@@ -356,170 +559,315 @@ def format(term, fmt, *args, **kwargs):
 
 
 def vformat(term, fmt, args, kwargs, width=None, hfill=False):
+    if '{' not in fmt and '}' not in fmt:
+        return _format_plain(fmt, width, hfill)
     line = vformat_line(fmt, args, kwargs, hfill=hfill)
     return line.render(term, width)
 
 
+def _format_plain(text, width, hfill):
+    '''
+    Format a string that has no replacement fields.
+
+    This produces the same output as rendering a TextLine with a single text
+    segment, but avoids building the line.  Plain text never changes the
+    terminal attributes, so no escape sequences are needed.
+    '''
+    segment = _shared_text_segment(text)
+    if width is None:
+        return segment.value
+
+    rendered_width = segment.rendered_width
+    if rendered_width >= width:
+        return segment.get_value(width)[0]
+    if not hfill:
+        return segment.value
+
+    if not isinstance(hfill, str):
+        hfill = ' '
+    padding = _hfill_segment(hfill).get_value(width - rendered_width)[0]
+    return segment.value + padding
+
+
 def format_line(fmt, *args, **kwargs):
     return vformat_line(fmt, args, kwargs, hfill=kwargs.get('hfill'))
 
 
 def vformat_line(fmt, args, kwargs, hfill=False):
     line = TextLine()
-    for segment in _FormatParser(fmt, args, kwargs):
-        line.segments.append(segment)
+    if '{' not in fmt and '}' not in fmt:
+        # Plain text, with no replacement fields
+        if fmt:
+            line.add_segment(_shared_text_segment(fmt))
+    else:
+        for segment in _bind_format(_compile_format(fmt), args, kwargs):
+            line.add_segment(segment)
 
     if hfill:
         if not isinstance(hfill, str):
             hfill = ' '
-        pad = PaddingSegment(hfill, min_width=0, default_width=0, precedence=2)
-        line.segments.append(pad)
+        line.add_segment(_hfill_segment(hfill))
     return line
 
 
-class _FormatParser:
-    def __init__(self, fmt, args, kwargs):
-        self.segments = []
-        self.auto_idx = 0
-
-        self.args = args
-        self.kwargs = kwargs
+@functools.lru_cache(maxsize=64)
+def _hfill_segment(value):
+    '''
+    Return the PaddingSegment used to fill the end of a line with the
+    specified text.
 
-        self.formatter = string.Formatter()
-        self.fmt_iter = self.formatter.parse(fmt)
+    The returned segment is shared with other callers, so it must not be
+    modified.
+    '''
+    return PaddingSegment(value, min_width=0, default_width=0, precedence=2)
 
-    def __iter__(self):
-        return self
 
-    def __next__(self):
-        if not self.segments:
-            self.parse_more()
+_formatter = string.Formatter()
 
-        return self.segments.pop(0)
 
-    def add_segment(self, segment):
-        self.segments.append(segment)
-
-    def parse_more(self):
-        literal, field_name, format_spec, conversion = next(self.fmt_iter)
-
-        if literal:
-            self.add_segment(TextSegment(literal))
-        if field_name is None:
-            return
+# Template opcodes.  See _compile_format().
+_OP_SEGMENT = 0
+_OP_AUTO_IDX = 1
+_OP_ARG = 2
+_OP_KWARG = 3
+_OP_GET_FIELD = 4
 
-        term_attrs, format_spec = self.parse_format_spec(format_spec)
-        self.parse_field(field_name, term_attrs, format_spec, conversion)
 
-    def parse_format_spec(self, value):
-        if not value:
-            return None, None
+@functools.lru_cache(maxsize=1024)
+def _compile_format(fmt):
+    '''
+    Parse a format string into a template.
 
-        # Interpret the format_spec field as terminal attributes,
-        # followed by an optional standard format_spec after another colon.
-        # e.g., {0:red:>30}
-        parts = value.split(':', 1)
-        term_attrs_str = parts[0]
-        if len(parts) == 1:
-            format_spec = None
-        else:
-            format_spec = parts[1]
+    The template is a tuple of (opcode, item) pairs.  For the parts of the
+    format string that do not depend on the arguments the opcode is
+    _OP_SEGMENT, and the item is a LineSegment.  For replacement fields the
+    item is a _Field, and the opcode says how to look up its value.
 
-        if term_attrs_str:
-            term_attrs = self.parse_term_attrs(term_attrs_str)
+    Templates are cached, so a format string only has to be parsed the
+    first time it is used.  The segments in the template are shared between
+    all users of the format string, and must not be modified.
+    '''
+    template = []
+    for item in _parse_format(fmt):
+        if isinstance(item, _Field):
+            template.append((item.op, item))
         else:
-            term_attrs = None
-        return term_attrs, format_spec
-
-    def parse_term_attrs(self, value):
-        modifier = AttributeModifier()
-        for attr in value.split(','):
-            if not attr:
-                continue
-
-            try:
-                attr_modifier = ATTRIBUTE_MODIFIERS[attr]
-            except KeyError:
-                raise Exception('unknown attribute %r' % (attr,))
-            modifier.combine_in_place(attr_modifier)
-        return modifier
-
-    def parse_field(self, field_name, term_attrs, format_spec, conversion):
-        if field_name is '':
-            if self.auto_idx is None:
+            template.append((_OP_SEGMENT, item))
+    return tuple(template)
+
+
+def _bind_format(template, args, kwargs):
+    '''
+    Generate the segments for a compiled format template, looking up the
+    replacement fields in args and kwargs.
+    '''
+    manual_idx = False
+    for op, item in template:
+        if op == _OP_SEGMENT:
+            yield item
+            continue
+
+        if op == _OP_AUTO_IDX:
+            if manual_idx:
                 raise Exception('cannot switch between manual field '
                                 'specification and auto-indexing')
-            obj = self.formatter.get_value(self.auto_idx,
-                                           self.args, self.kwargs)
-            self.auto_idx += 1
-            self.append_literal(obj, term_attrs, format_spec, conversion)
+            obj = args[item.key]
+        elif op == _OP_KWARG:
+            obj = kwargs[item.key]
+        elif op == _OP_ARG:
+            manual_idx = True
+            obj = args[item.key]
+        else:
+            if item.positional:
+                manual_idx = True
+            obj = _formatter.get_field(item.field_name, args, kwargs)[0]
+        yield item.get_segment(obj)
+
+
+class _Field:
+    '''
+    A replacement field in a compiled format template whose value comes from
+    the format arguments.
+
+    For auto-indexed fields and plain argument names, key is the index or
+    name to look up directly in args or kwargs.  It is None for field names
+    with attribute or element accessors, which are looked up with
+    string.Formatter.get_field().
+    '''
+    __slots__ = ('field_name', 'term_attrs', 'format_spec', 'conversion',
+                 'op', 'positional', 'key')
+
+    def __init__(self, field_name, term_attrs, format_spec, conversion,
+                 auto_idx=None):
+        self.field_name = field_name
+        self.term_attrs = term_attrs
+        self.format_spec = format_spec
+        self.conversion = conversion
+
+        if auto_idx is not None:
+            self.op = _OP_AUTO_IDX
+            self.positional = True
+            self.key = auto_idx
             return
 
-        if field_name.startswith('"') or field_name.startswith("'"):
-            # Note that we still rely on string.Formatter() to parse the field
-            # name, so this isn't really quite like a normal quoted string.
-            # The characters '!', ':', '{', and '}' cannot appear inside the
-            # quoted string.  Additionally, other quote characters inside the
-            # field name will not terminate the string.
-            quote = field_name[0]
-            if not field_name.endswith(quote):
-                raise Exception('mismatched %s in field_name: %r' %
-                                (quote, field_name))
-            value = field_name[1:-1]
-            self.append_literal(value, term_attrs, format_spec, None)
-            return
+        arg_name = field_name.split('.', 1)[0].split('[', 1)[0]
+        self.positional = arg_name.isdecimal()
+        if arg_name != field_name:
+            self.op = _OP_GET_FIELD
+            self.key = None
+        elif self.positional:
+            self.op = _OP_ARG
+            self.key = int(arg_name)
+        else:
+            self.op = _OP_KWARG
+            self.key = arg_name
+
+    def get_segment(self, value):
+        return _literal_segment(value, self.term_attrs, self.format_spec,
+                                self.conversion)
+
+
+def _literal_segment(value, term_attrs, format_spec, conversion):
+    if conversion is not None:
+        value = _formatter.convert_field(value, conversion)
+    elif type(value) is not str:
+        # Most arguments are already strings, so skip the str() call for them
+        value = str(value)
+
+    if format_spec:
+        value = value.__format__(format_spec)
+
+    segment = TextSegment(value)
+    segment.attr_modifier = term_attrs
+    return segment
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_term_attrs(value):
+    '''
+    Parse a terminal attribute list into an AttributeModifier.
+
+    The results are cached, so identical attribute lists share the same
+    AttributeModifier object.  The returned modifier must not be modified.
+    '''
+    modifier = AttributeModifier()
+    # Bind the lookups to locals, since they are used once per attribute
+    lookup = ATTRIBUTE_MODIFIERS.__getitem__
+    combine = modifier.combine_in_place
+    for attr in _iter_list(value):
+        if not attr:
+            continue
+
+        try:
+            attr_modifier = lookup(attr)
+        except KeyError:
+            raise Exception('unknown attribute %r' % (attr,))
+        combine(attr_modifier)
+    return modifier
+
+
+# Maps padding parameter names to the PaddingSegment attribute they set
+_PADDING_PARAMS = {
+    'min': 'min_width',
+    'default': 'default_width',
+    'weight': 'pad_weight',
+}
+
+
+def _parse_format(fmt):
+    '''
+    Parse a format string, generating the items of its compiled template.
+    '''
+    auto_idx = 0
+
+    # Formatter.parse() splits literal text at escaped braces, so
+    # several literal chunks may appear in a row.  Join them into a single
+    # segment, and emit it when we reach the next field.
+    literals = []
+    for literal, field_name, format_spec, conversion in _formatter.parse(fmt):
+        if literal:
+            literals.append(literal)
+        if field_name is None:
+            continue
 
-        if field_name == '+':
-            segment = TextSegment('')
-            segment.attr_modifier = term_attrs
-            segment.permanent_attr = True
-            self.add_segment(segment)
-            return
+        if literals:
+            yield _shared_text_segment(''.join(literals))
+            literals = []
 
-        if field_name.startswith('='):
-            # Padding
-            segment = self.parse_padding(field_name[1:])
-            segment.attr_modifier = term_attrs
-            self.add_segment(segment)
-            return
+        term_attrs, format_spec = _parse_format_spec(format_spec)
+        if not field_name:
+            yield _Field(field_name, term_attrs, format_spec, conversion,
+                         auto_idx=auto_idx)
+            auto_idx += 1
+        else:
+            yield _parse_field(field_name, term_attrs, format_spec,
+                               conversion)
+
+    if literals:
+        yield _shared_text_segment(''.join(literals))
+
+
+def _parse_format_spec(value):
+    if not value:
+        return None, None
+
+    # Interpret the format_spec field as terminal attributes,
+    # followed by an optional standard format_spec after another colon.
+    # e.g., {0:red:>30}
+    term_attrs_str, sep, format_spec = value.partition(':')
+    if not sep:
+        format_spec = None
+
+    if term_attrs_str:
+        term_attrs = _parse_term_attrs(term_attrs_str)
+    else:
+        term_attrs = None
+    return term_attrs, format_spec
+
+
+def _parse_field(field_name, term_attrs, format_spec, conversion):
+    # field_name is never empty here; auto-indexed fields are handled by
+    # _parse_format().  Dispatch on the first character.
+    first = field_name[0]
+    if first == '"' or first == "'":
+        # Note that we still rely on string.Formatter() to parse the field
+        # name, so this isn't really quite like a normal quoted string.
+        # The characters '!', ':', '{', and '}' cannot appear inside the
+        # quoted string.  Additionally, other quote characters inside the
+        # field name will not terminate the string.
+        if not field_name.endswith(first):
+            raise Exception('mismatched %s in field_name: %r' %
+                            (first, field_name))
+        value = field_name[1:-1]
+        return _literal_segment(value, term_attrs, format_spec, None)
+
+    if field_name == '+':
+        segment = copy.copy(_shared_text_segment(''))
+        segment.attr_modifier = term_attrs
+        segment.permanent_attr = True
+        return segment
 
-        obj, used_key = self.formatter.get_field(field_name,
-                                                 self.args, self.kwargs)
-        if isinstance(used_key, int):
-            self.auto_idx = None
-        self.append_literal(obj, term_attrs, format_spec, conversion)
-
-    def parse_padding(self, value):
-        segment = PaddingSegment()
-        if not value:
-            return segment
-
-        params = value.split(',')
-        for p in params:
-            parts = p.split('=', 1)
-            if len(parts) != 2:
-                raise Exception('padding properties must be of the form '
-                                'name=value: %r' % p)
-            name, value = parts
-            if name == 'min':
-                segment.min_width = int(value)
-            elif name == 'default':
-                segment.default_width = int(value)
-            elif name == 'weight':
-                segment.pad_weight = int(value)
-            else:
-                raise Exception('unknown padding property %r' % (name,))
+    if first == '=':
+        # Padding
+        segment = _parse_padding(field_name[1:])
+        segment.attr_modifier = term_attrs
         return segment
 
-    def append_literal(self, value, term_attrs, format_spec, conversion):
-        if conversion is not None:
-            value = self.formatter.convert_field(value, conversion)
-        else:
-            value = str(value)
+    return _Field(field_name, term_attrs, format_spec, conversion)
 
-        if format_spec:
-            value = value.__format__(format_spec)
 
-        segment = TextSegment(value)
-        segment.attr_modifier = term_attrs
-        self.add_segment(segment)
+def _parse_padding(value):
+    segment = PaddingSegment()
+    if not value:
+        return segment
+
+    for name, value in _iter_params(value):
+        if value is None:
+            raise Exception('padding properties must be of the form '
+                            'name=value: %r' % name)
+        try:
+            segment_attr = _PADDING_PARAMS[name]
+        except KeyError:
+            raise Exception('unknown padding property %r' % (name,))
+        setattr(segment, segment_attr, int(value))
+    return segment
@@ -2,15 +2,20 @@
 #
 # Copyright (c) 2012, Adam Simpkins
 #
+import array
 import curses
 import errno
+import functools
 import logging
 import os
 import select
 import threading
+import time
 
 
 class EscapedKey:
+    __slots__ = ('name', 'cap', 'description')
+
     def __init__(self, name, cap, description):
         self.name = name.upper()
         self.cap = cap
@@ -24,28 +29,62 @@ class EscapedKey:
 
 
 class TermInput:
-    def __init__(self, fileno, escape_table=None, encoding='utf-8'):
+    def __init__(self, fileno, escape_table=None, encoding='utf-8',
+                 read_bufsize=4096):
         self.fileno = fileno
-        self.read_bufsize = 128
+        self.read_bufsize = read_bufsize
 
         if escape_table is None:
-            escape_table = build_escape_table()
+            escape_table = _shared_escape_table(os.environ.get('TERM', 'dumb'))
         self.escape_table = escape_table
+        self._escape_starts = escape_table.start_bytes
 
         self.poll = select.poll()
         self.poll.register(self.fileno, select.POLLIN)
         self._buffer = bytearray()
         self.escape_time = 0.005
 
+        # Input is read into a reusable scratch buffer, to avoid allocating
+        # a new bytes object for every read.
+        self._input_file = open(self.fileno, 'rb', buffering=0,
+                                closefd=False)
+        self._read_view = memoryview(bytearray(self.read_bufsize))
+
         self.on_resize = None
         self._resized = threading.Event()
 
+        # signal_resize() writes to this pipe to wake up a getch() call that
+        # is waiting for input.
+        self._resize_rfd, self._resize_wfd = os.pipe()
+        os.set_blocking(self._resize_rfd, False)
+        os.set_blocking(self._resize_wfd, False)
+        self.poll.register(self._resize_rfd, select.POLLIN)
+
     def signal_resize(self):
         '''
-        Signal that a resize has occurred, and should be processed on the next
-        call to getch().
+        Signal that a resize has occurred, and should be processed by
+        getch().
+
+        This is safe to call from a signal handler.  If getch() is currently
+        waiting for input it processes the resize immediately, otherwise it
+        is processed on the next call to getch().  Multiple resizes signalled
+        before getch() gets to run are only processed once.
         '''
+        if self._resized.is_set():
+            return
         self._resized.set()
+        try:
+            os.write(self._resize_wfd, b'\0')
+        except BlockingIOError:
+            # The pipe is full, so getch() already has a wakeup pending
+            pass
+
+    def _drain_resize_pipe(self):
+        try:
+            while os.read(self._resize_rfd, 64):
+                pass
+        except BlockingIOError:
+            pass
 
     def _check_resize(self):
         if self._resized.is_set():
@@ -53,13 +92,33 @@ class TermInput:
             if self.on_resize is not None:
                 self.on_resize()
 
+    def close(self):
+        '''
+        Release the resize pipe.
+
+        The TermInput cannot be used after it has been closed.  The input fd
+        itself belongs to the caller, and is left open.
+        '''
+        self._input_file.close()
+        os.close(self._resize_rfd)
+        os.close(self._resize_wfd)
+
     def getch(self, escape_time=None):
         if escape_time is None:
             escape_time = self.escape_time
         self._check_resize()
 
         # If we already have a full keycode in the buffer,
-        # return it without trying to read more data
+        # return it without trying to read more data.
+        #
+        # Check for a plain ASCII character inline first.  This is by far the
+        # most common case, particularly when draining pasted text.
+        buf = self._buffer
+        if buf:
+            k = buf[0]
+            if k <= 0x7f and not self._escape_starts[k]:
+                del buf[0]
+                return chr(k)
         ch = self._pop_keycode()
         if ch is not None:
             return ch
@@ -68,15 +127,25 @@ class TermInput:
         timeout = None
         while True:
             try:
-                self.poll.poll(timeout)
-                data = os.read(self.fileno, self.read_bufsize)
+                events = self.poll.poll(timeout)
             except IOError as ex:
                 if ex.errno != errno.EINTR:
                     raise
                 self._check_resize()
                 continue
 
-            self._buffer.extend(data)
+            got_input = False
+            for fd, event in events:
+                if fd == self._resize_rfd:
+                    self._drain_resize_pipe()
+                    self._check_resize()
+                else:
+                    self._read_available()
+                    got_input = True
+            if not got_input and not self._buffer:
+                # We were only woken up to process a resize, and have no
+                # partial input pending.  Keep waiting for input.
+                continue
 
             # Check to see if we have a full keycode now
             ch = self._pop_keycode()
@@ -84,29 +153,56 @@ class TermInput:
                 return ch
 
             # Not a full keycode.  We have to wait for more data.
+            # (Note that poll() takes its timeout in milliseconds.)
             if end is None:
-                if timeout is None or timeout <= 0:
+                if escape_time is None or escape_time <= 0:
                     # Return whatever data we have immediately
                     break
                 end = time.time() + escape_time
-                timeout = escape_time
+                timeout = escape_time * 1000
             else:
                 now = time.time()
                 if now >= end:
                     break
-                timeout = end - now
+                timeout = (end - now) * 1000
 
         # We ran out of time.  Just return the first byte we have,
         # even though it isn't a full key code.
         return self._pop_byte()
 
+    def _read_available(self):
+        '''
+        Read the data that is currently available on the input fd.
+
+        If a read fills the whole read buffer, more data is probably
+        waiting (for instance when text is pasted), so keep reading as long
+        as poll() says more input is ready.  This lets the caller process
+        the whole batch at once, rather than going back through poll() and
+        the keycode parsing for every read_bufsize chunk.
+
+        Only events on the input fd itself count here: self.poll also
+        watches the resize pipe, and a pending resize must not make us block
+        in read() on a tty with no more input.
+        '''
+        view = self._read_view
+        fileno = self.fileno
+        while True:
+            length = self._input_file.readinto(view)
+            if not length:
+                return
+            self._buffer.extend(view[:length])
+            if length < len(view):
+                return
+            if not any(fd == fileno for fd, event in self.poll.poll(0)):
+                return
+
     def _pop_keycode(self):
         if not self._buffer:
             return None
 
         k = self._buffer[0]
         # Check for the start of an escape sequence
-        if k in self.escape_table:
+        if self._escape_starts[k]:
             return self._pop_escape_seq()
 
         # TODO: For now, we only support UTF-8.
@@ -118,32 +214,39 @@ class TermInput:
 
         # Handle the simple case of an ASCII character
         if k <= 0x7f:
-            self._buffer = self._buffer[1:]
+            del self._buffer[0]
             return chr(k)
 
         # This is the start of a UTF-8 encoded character
         # (For simplicity, at the moment we assume all input is UTF-8.)
-        idx = 0
-        for idx, k in enumerate(self._buffer):
-            if k <= 0x7f:
-                assert idx > 0
+        # The lead byte tells us how long the character is, so we can decode
+        # it with a single call once all of its bytes have arrived.
+        length = _UTF8_LENGTHS[k]
+        if length == 0:
+            # A continuation byte or invalid lead byte
+            return self._pop(1, decode=True)
+
+        buf = self._buffer
+        for idx in range(1, min(length, len(buf))):
+            if (buf[idx] & 0xc0) != 0x80:
                 # previous data was bogus utf-8 input
                 return self._pop(idx, decode=True)
-            elif (k & 0xc0) == 0x80:
-                return self._pop(idx + 1, decode=True)
-
-        return None
+        if len(buf) < length:
+            # Wait for the rest of the character
+            return None
+        return self._pop(length, decode=True)
 
     def _pop_escape_seq(self):
-        cur_map = self.escape_table
+        transitions = self.escape_table.transitions
+        accept = self.escape_table.accept
+        state = 0
         for idx, k in enumerate(self._buffer):
-            old_map = cur_map
-            cur_map = cur_map.get(k)
-            if cur_map is None:
+            state = transitions[(state << 8) | k]
+            if state == 0:
                 # This doesn't match any escape sequence we know about
                 return self._pop_byte()
 
-            key = cur_map.get(None)
+            key = accept[state]
             if key is not None:
                 self._pop(idx + 1, decode=False)
                 return key
@@ -160,43 +263,104 @@ class TermInput:
 
     def _pop(self, length, decode):
         ret = self._buffer[:length]
-        self._buffer = self._buffer[length:]
+        # Delete in place rather than slicing off a new copy of the rest of
+        # the buffer.  bytearray removes data from the front just by
+        # advancing its start offset, so this doesn't copy the remaining
+        # bytes, which matters when a large paste is being consumed one key
+        # at a time.
+        del self._buffer[:length]
         if decode:
             return ret.decode('utf-8', errors='surrogateescape')
         else:
             return ret
 
 
+# The length of a UTF-8 encoded character, indexed by its first byte.
+# Continuation bytes and invalid lead bytes are 0.
+_UTF8_LENGTHS = bytes([1] * 128 + [0] * 64 + [2] * 32 + [3] * 16 +
+                      [4] * 8 + [0] * 8)
+
+
+class EscapeTable:
+    '''
+    A state machine for recognizing terminal escape sequences.
+
+    The transitions are stored in a single flat array indexed by
+    (state << 8) | byte, holding the next state, or 0 if the byte cannot
+    continue a known escape sequence from that state.  State 0 is the start
+    state; no transition ever leads back to it.  accept[state] is the key
+    that has been recognized on reaching a state, or None.
+
+    start_bytes is a 256-entry lookup table that is non-zero for the bytes
+    that can start an escape sequence.
+    '''
+    def __init__(self):
+        self.transitions = array.array('H', bytes(512))
+        self.accept = [None]
+        self.start_bytes = bytearray(256)
+
+    def add_key(self, value, key):
+        self.start_bytes[value[0]] = 1
+        state = 0
+        for c in value:
+            if self.accept[state] is not None:
+                # We won't ever be able to match this key,
+                # since another key is a prefix of it
+                logging.warning('conflicting key strings: %s and %s',
+                                self.accept[state], key)
+            next_state = self.transitions[(state << 8) | c]
+            if next_state == 0:
+                next_state = len(self.accept)
+                self.transitions.frombytes(bytes(512))
+                self.accept.append(None)
+                self.transitions[(state << 8) | c] = next_state
+            state = next_state
+
+        if self.accept[state] is not None:
+            logging.warning('conflicting key strings: %s and %s',
+                            self.accept[state], key)
+        elif any(self.transitions[state << 8:(state + 1) << 8]):
+            # We won't ever be able to match any of the keys that
+            # continue on from here, since this key is a prefix of them.
+            logging.warning('key string for %s is a prefix of other keys',
+                            key)
+        self.accept[state] = key
+
+    def __contains__(self, byte):
+        '''
+        Returns True if the specified byte value can start an escape sequence.
+        '''
+        return self.start_bytes[byte] != 0
+
+
 def build_escape_table():
-    escape_table = {}
+    escape_table = EscapeTable()
 
-    global _escape_keys
     for key in _escape_keys:
         value = curses.tigetstr(key.cap)
         if not value:
             continue
+        escape_table.add_key(value, key)
 
-        cur = escape_table
-        for c in value:
-            if None in cur:
-                # We won't ever be able to match the current key,
-                # since another key is a prefix of it
-                logging.warning('conflicting key strings: %s and %s',
-                                cur[None], key)
-            cur = cur.setdefault(c, {})
+    return escape_table
 
-        # We won't ever be able to match any of the keys currently
-        # in this mapping, since this key is a prefix of them.
-        if cur:
-            logging.warning('conflicting key strings: %s and %s',
-                            cur[None], ', '.join(str(k) for k in cur.values()))
 
-        cur[None] = key
+@functools.lru_cache(maxsize=8)
+def _shared_escape_table(term_type):
+    '''
+    Return the escape table for the specified terminal type.
 
-    return escape_table
+    Looking up all of the key capabilities is fairly expensive, and the
+    result only depends on the terminal type, so the table is built once and
+    shared by every TermInput for that terminal.  The returned table must
+    not be modified.
+
+    curses.setupterm() must already have been called for term_type.
+    '''
+    return build_escape_table()
 
 
-_escape_keys = [
+_escape_keys = (
     EscapedKey('key_a1', 'ka1', 'upper left of keypad'),
     EscapedKey('key_a3', 'ka3', 'upper right of keypad'),
     EscapedKey('key_b2', 'kb2', 'center of keypad'),
@@ -348,7 +512,7 @@ _escape_keys = [
     EscapedKey('key_up', 'kcuu1', 'up-arrow key'),
     EscapedKey('keypad_local', 'rmkx', 'leave keyboard_transmit mode'),
     EscapedKey('keypad_xmit', 'smkx', 'enter keyboard_transmit mode'),
-]
+)
 
 
 class ControlKey:
@@ -42,12 +42,12 @@ from .attr import *
 from . import keys
 from . import format
 
+# The struct winsize layout returned by the TIOCGWINSZ ioctl
+_WINSIZE = struct.Struct('hhhh')
+_WINSIZE_BUF = bytes(_WINSIZE.size)
 
-class Terminal:
-    _ATTR_PUSH = object()
-    _ATTR_POP = object()
-    _ATTR_SET = object()
 
+class Terminal:
     def __init__(self, altscreen=False, height=0, width=0,
                  cursor=False, sigwinch=True):
         self.stream = sys.__stdout__
@@ -63,6 +63,15 @@ class Terminal:
         self._keypad_on = False
         self._term_modes = []
 
+        # Maps (cap, args) --> capability string.  See get_cap().
+        self._cap_cache = {}
+        # Output buffered by frame(), or None when not inside a frame.
+        self._frame_buffer = None
+        # The last size read from the terminal.  This is only kept while
+        # our SIGWINCH handler is installed to tell us when it changes.
+        self._tty_size = None
+        self._sigwinch_registered = False
+
         self._initterm()
         self._input = keys.TermInput(sys.__stdin__.fileno())
         self._input.on_resize = self._process_resize
@@ -74,6 +83,8 @@ class Terminal:
 
     def register_sigwinch(self):
         signal.signal(signal.SIGWINCH, self._sigwinch_handler)
+        self._sigwinch_registered = True
+        self._tty_size = None
 
     def _sigwinch_handler(self, signum, frame):
         # Just record that we were resized.  getch() will then call
@@ -82,8 +93,24 @@ class Terminal:
         self._input.signal_resize()
 
     def _process_resize(self):
+        # Forget the cached size here rather than in the signal handler.  The
+        # handler may run between the ioctl in _get_dimensions() and storing
+        # its result, which would leave the old size cached.  This always
+        # runs after the signal, so the size is re-read.
+        self._tty_size = None
         self.recompute_size()
 
+    def close(self):
+        '''
+        Release the resources used for reading terminal input.
+
+        The terminal cannot be used to read input after it has been closed.
+        '''
+        if self._sigwinch_registered:
+            signal.signal(signal.SIGWINCH, signal.SIG_DFL)
+            self._sigwinch_registered = False
+        self._input.close()
+
     def get_escape_time(self):
         return self._input.escape_time
 
@@ -135,21 +162,60 @@ class Terminal:
             width = os.environ.get('COLUMNS')
             height = os.environ.get('LINES')
             if width is not None and height is not None:
-                return width, height
-
-        # Otherwise fall back and query the terminal
-        ret = fcntl.ioctl(self.stream.fileno(), termios.TIOCGWINSZ, bytes(8))
-        rows, cols, xpixel, ypixel = struct.unpack('hhhh', ret)
+                return int(width), int(height)
+
+        # Otherwise fall back and query the terminal, unless we already know
+        # its size and haven't been told that it changed since.
+        if self._tty_size is not None:
+            return self._tty_size
+
+        ret = fcntl.ioctl(self.stream.fileno(), termios.TIOCGWINSZ,
+                          _WINSIZE_BUF)
+        rows, cols, xpixel, ypixel = _WINSIZE.unpack(ret)
+        if self._sigwinch_registered:
+            self._tty_size = (cols, rows)
         return cols, rows
 
     def flush(self):
+        if self._frame_buffer:
+            self.stream.write(''.join(self._frame_buffer))
+            self._frame_buffer.clear()
         self.stream.flush()
 
     def write(self, text, *args, **kwargs):
         if args or kwargs:
             text = format.format(text, *args, **kwargs)
 
-        self.stream.write(text)
+        if self._frame_buffer is not None:
+            self._frame_buffer.append(text)
+        else:
+            self.stream.write(text)
+
+    @contextmanager
+    def frame(self):
+        '''
+        A contextmanager that collects all output written inside it, and
+        passes it to the output stream with a single write when exiting the
+        context.
+
+        Redrawing the screen involves many small writes for cursor motion,
+        attribute changes and text.  Wrapping the redraw in frame() avoids
+        going through the output stream for each one.  Calling flush() inside
+        the frame still sends everything written so far.  The output is not
+        flushed when the frame exits; call flush() as usual for that.
+        '''
+        if self._frame_buffer is not None:
+            # Nested inside another frame, which will write everything
+            yield
+            return
+
+        self._frame_buffer = []
+        try:
+            yield
+        finally:
+            buf = self._frame_buffer
+            self._frame_buffer = None
+            self.stream.write(''.join(buf))
 
     def region(self, x, y, width=0, height=0):
         return self._regions.new_region(self, self, x, y, width, height)
@@ -169,13 +235,22 @@ class Terminal:
         self.write_cap('clear')
 
     def get_cap(self, cap, *args):
+        # The same few capabilities are used over and over when drawing,
+        # so cache the results rather than calling into curses every time.
+        key = (cap, args)
+        value = self._cap_cache.get(key)
+        if value is not None:
+            return value
+
         attr = curses.tigetstr(cap)
         if attr is None:
-            return ''
-
-        if args:
-            attr = curses.tparm(attr, *args)
-        return attr.decode('utf-8')
+            value = ''
+        else:
+            if args:
+                attr = curses.tparm(attr, *args)
+            value = attr.decode('utf-8')
+        self._cap_cache[key] = value
+        return value
 
     def write_cap(self, cap, *args):
         self.write(self.get_cap(cap, *args))
@@ -189,6 +264,7 @@ class Terminal:
 
     def _initterm(self):
         curses.setupterm(os.environ.get('TERM', 'dumb'), self.stream.fileno())
+        self._cap_cache.clear()
 
     def change_input_mode(self, raw, echo=False, drop_input=True,
                           signal_keys=None, keypad=None):
@@ -342,6 +418,9 @@ class Terminal:
             restore_fn()
 
     def _reenter_term_mode(self):
+        # We may have missed resizes while another program was using the
+        # terminal, or while we were stopped.
+        self._tty_size = None
         for enter_fn, restore_fn in self._term_modes:
             enter_fn()
 
@@ -376,32 +455,46 @@ class Region:
         self._regions = RegionContainer()
         self.on_resize = None
 
+        self._geometry = None
         self.recompute_size()
 
     def region(self, x, y, width=0, height=0):
         return self._regions.new_region(self.term, self, x, y, width, height)
 
     def recompute_size(self):
+        parent_width = self.parent.width
+        parent_height = self.parent.height
+
         if self.desired_x >= 0:
-            self.x = self.desired_x
+            x = self.desired_x
         else:
-            self.x = max(self.parent.width + self.desired_x, 0)
+            x = max(parent_width + self.desired_x, 0)
         if self.desired_y >= 0:
-            self.y = self.desired_y
+            y = self.desired_y
         else:
-            self.y = max(self.parent.height + self.desired_y, 0)
+            y = max(parent_height + self.desired_y, 0)
 
-        max_width = self.parent.width - self.x
+        max_width = parent_width - x
         if self.desired_width <= 0:
-            self.width = max(max_width + self.desired_width, 0)
+            width = max(max_width + self.desired_width, 0)
         else:
-            self.width = min(self.desired_width, max_width)
+            width = min(self.desired_width, max_width)
 
-        max_height = self.parent.height - self.y
+        max_height = parent_height - y
         if self.desired_height <= 0:
-            self.height = max(max_height + self.desired_height, 0)
+            height = max(max_height + self.desired_height, 0)
         else:
-            self.height = min(self.desired_height, max_height)
+            height = min(self.desired_height, max_height)
+
+        geometry = (x, y, width, height)
+        if geometry == self._geometry:
+            # Nothing changed, so our subregions don't need updating either
+            return
+        self._geometry = geometry
+        self.x, self.y, self.width, self.height = geometry
+
+        # The output used by clear() depends on our size; see clear()
+        self._clear_data = None
 
         self._regions.recompute_sizes()
 
@@ -470,8 +563,9 @@ class Region:
         width = self.width - x
         data = self.term.vformat(text, args, kwargs, width=width, hfill=hfill)
 
-        self.term.move(self.x + x, self.y + y)
-        self.term.write(data)
+        # Send the cursor motion and the text in a single write
+        move = self.term.get_cap('cup', self.y + y, self.x + x)
+        self.term.write(move + data)
 
     def clear(self):
         if (self.x == 0 and self.y == 0 and
@@ -479,6 +573,16 @@ class Region:
             self.term.clear()
             return
 
-        for y in range(self.height):
-            self.term.move(self.x, self.y + y)
-            self.term.write(' ' * self.width)
+        # Build the cursor motion and blanking for every line once, and
+        # reuse it until the region is resized.
+        if self._clear_data is None:
+            # Use the erase-characters capability if the terminal has one,
+            # rather than sending a full line of spaces for every row.
+            # (Note that ech treats a count of 0 as 1.)
+            blank = ' ' * self.width
+            if self.width > 0:
+                blank = self.term.get_cap('ech', self.width) or blank
+            self._clear_data = ''.join(
+                self.term.get_cap('cup', self.y + y, self.x) + blank
+                for y in range(self.height))
+        self.term.write(self._clear_data)
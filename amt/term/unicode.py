@@ -4,6 +4,7 @@
 #
 import ctypes
 import ctypes.util
+import re
 
 # Python doesn't expose wcwidth() or wcswidth() (yet).
 # Some background (including descriptions of common terminal behaviors) is
@@ -16,9 +17,19 @@ _libc = None
 _VERTICAL_SEPARATORS = set(['\n', '\v', '\f', '\r',
                             '\u0084', '\u0085', '\u008d',
                             '\u2028', '\u2029'])
+_VERTICAL_SEPARATOR_RE = re.compile(
+    '[%s]' % re.escape(''.join(sorted(_VERTICAL_SEPARATORS))))
 
 DEFAULT_TAB_STOP = 8
 
+# Maps characters to their wcwidth() result.
+#
+# Calling wcwidth() through ctypes is far more expensive than the lookup
+# itself, and the same small set of characters is rendered over and over.
+# Note that wcwidth() depends on the LC_CTYPE locale, so the locale should be
+# set up before any text is rendered.
+_char_widths = {}
+
 
 def get_libc():
     global _libc
@@ -28,6 +39,12 @@ def get_libc():
     return _libc
 
 
+def _wcwidth(char):
+    width = get_libc().wcwidth(ctypes.c_wchar(char))
+    _char_widths[char] = width
+    return width
+
+
 def renderable_line(value, tab_stop=DEFAULT_TAB_STOP, max_width=None):
     '''
     Convert a unicode string into a line that can be rendered on the
@@ -47,39 +64,62 @@ def renderable_line(value, tab_stop=DEFAULT_TAB_STOP, max_width=None):
     characters.  Note that not all terminals render characters the same way, so
     this may not be 100% accurate for all terminals.
     '''
-    libc = get_libc()
-
-    result = []
+    # The line ends at the first character that would cause the terminal to
+    # move forwards or backwards a line.
+    match = _VERTICAL_SEPARATOR_RE.search(value)
+    if match is not None:
+        value = value[:match.start()]
+
+    # Fast path for the common case of plain printable ASCII text, where
+    # every character is exactly one cell wide.
+    if value.isascii() and value.isprintable():
+        if max_width is not None and len(value) > max_width:
+            value = value[:max(max_width, 0)]
+        return value, len(value)
+
+    char_widths = _char_widths
+
+    # Until we hit a tab or control character the output is just a prefix of
+    # the input, so we only start building a separate result list once the
+    # output actually differs.  start is the index of the first character
+    # that has not yet been copied into result.
+    result = None
+    start = 0
+    end = len(value)
     width = 0
-    for char in value:
+    for idx, char in enumerate(value):
         if max_width is not None and width >= max_width:
+            end = idx
             break
 
-        char_width = libc.wcwidth(ctypes.c_wchar(char))
+        char_width = char_widths.get(char)
+        if char_width is None:
+            char_width = _wcwidth(char)
         if char_width >= 0:
             # Common case: not a control character
             new_width = width + char_width
             # If we have a multi-cell character that would make us
             # exceed the width, stop before appending it.
             if max_width is not None and new_width > max_width:
+                end = idx
                 break
-            result.append(char)
             width = new_width
             continue
 
-        # This is a control character.  If it is a vertical separator
-        # (that would cause the terminal to move forwards or backwards a
-        # line), truncate the line here.
-        if char in _VERTICAL_SEPARATORS:
-            break
+        # This is a control character.
+        # (Vertical separators have already been stripped off above.)
+        if result is None:
+            result = []
+        result.append(value[start:idx])
+        start = idx + 1
 
         # Expand tabs to spaces
         if char == '\t':
-            next_width = next_tab_stop(width, tab_stop)
+            # (This is next_tab_stop(), inlined.)
+            next_width = (width // tab_stop + 1) * tab_stop
             if max_width is not None:
-                next_width = max(next_width, max_width)
-            num_spaces = next_width - width
-            result.extend([' '] * num_spaces)
+                next_width = min(next_width, max_width)
+            result.append(' ' * (next_width - width))
             width = next_width
             continue
 
@@ -87,6 +127,9 @@ def renderable_line(value, tab_stop=DEFAULT_TAB_STOP, max_width=None):
         # Just skip it.
         continue
 
+    if result is None:
+        return value[:end], width
+    result.append(value[start:end])
     return ''.join(result), width
 
 
@@ -100,4 +143,4 @@ def truncate_line(value, max_width):
 
 
 def next_tab_stop(pos, tab_stop=DEFAULT_TAB_STOP):
-    return (1 + int(pos / tab_stop)) * tab_stop
+    return (pos // tab_stop + 1) * tab_stop
@@ -2,6 +2,8 @@
 #
 # Copyright (c) 2012, Adam Simpkins
 #
+import functools
+
 from ..containers import WeakrefSet
 
 from .terminal import Region
@@ -54,7 +56,8 @@ class Drawable:
 
     def redraw(self, flush=True):
         assert self.visible
-        self._redraw()
+        with self.term.frame():
+            self._redraw()
         if flush:
             self.term.flush()
 
@@ -189,8 +192,9 @@ class ListSelection(Drawable):
             # only redraw the 2 lines that changed
             old_line_idx = old_idx - self.page_start
             new_line_idx = self.cur_idx - self.page_start
-            self.render_item(old_line_idx, old_idx)
-            self.render_item(new_line_idx, self.cur_idx)
+            with self.term.frame():
+                self.render_item(old_line_idx, old_idx)
+                self.render_item(new_line_idx, self.cur_idx)
 
         if flush:
             self.region.term.flush()
@@ -203,16 +207,19 @@ class ListSelection(Drawable):
         Returns True if self.page_start changed, and False if self.page_start
         did not need to be adjusted.
         '''
+        # Move by whole pages, so the page boundaries stay where they were.
+        # Compute the number of pages to move directly, rather than stepping
+        # one page at a time, since a jump may cover a very long list.
+        height = self.region.height
+        if height <= 0:
+            return False
         if self.page_start > self.cur_idx:
-            while self.page_start > self.cur_idx:
-                self.page_start -= self.region.height
-                if self.page_start < 0:
-                    self.page_start = 0
-                    break
+            num_pages = -(-(self.page_start - self.cur_idx) // height)
+            self.page_start = max(self.page_start - num_pages * height, 0)
             return True
-        elif self.page_start + self.region.height <= self.cur_idx:
-            while self.page_start + self.region.height <= self.cur_idx:
-                self.page_start += self.region.height
+        elif self.page_start + height <= self.cur_idx:
+            num_pages = (self.cur_idx - self.page_start) // height
+            self.page_start += num_pages * height
             return True
         else:
             return False
@@ -248,30 +255,31 @@ class ListSelection(Drawable):
         selected = (item_idx == self.cur_idx)
         result = self.get_item_format(item_idx, selected)
 
-        args = None
+        # Dispatch on the result shape once.  The common (fmt, kwargs) and
+        # plain string results don't need the args validation below.
+        args = ()
         kwargs = None
         if isinstance(result, str):
             fmt = result
-        elif len(result) == 1:
-            fmt = result[0]
         elif len(result) == 2:
-            fmt = result[0]
-            if isinstance(result[1], (list, tuple)):
-                args = result[1]
-            else:
-                kwargs = result[1]
+            fmt, kwargs = result
+            if isinstance(kwargs, (list, tuple)):
+                args = kwargs
+                kwargs = None
         elif len(result) == 3:
+            fmt, args, kwargs = result
+            if args is None:
+                args = ()
+            elif not isinstance(args, (list, tuple)):
+                raise Exception('get_item_format() must return the args as a '
+                                'tuple or list')
+        elif len(result) == 1:
             fmt = result[0]
-            args = result[1]
-            kwargs = result[2]
+        else:
+            fmt = None
 
         if not isinstance(fmt, str):
             raise Exception('get_item_format() must return a string format')
-        if args is None:
-            args = ()
-        elif not isinstance(args, (list, tuple)):
-            raise Exception('get_item_format() must return the args as a '
-                            'tuple or list')
         if kwargs is None:
             kwargs = {}
         elif not hasattr(kwargs, '__getitem__'):
@@ -296,15 +304,27 @@ class FixedListSelection(ListSelection):
     def get_item_format(self, item_idx, selected):
         item = self.items[item_idx]
 
-        num_width = len(str(len(self.items)))
-        fmt = '{idx:red:>%d} {item}' % (num_width,)
+        fmt = _fixed_list_item_format(len(self.items), selected)
         kwargs = {'idx': item_idx, 'item': item}
-
-        if selected:
-            fmt = '{+:reverse}' + fmt
         return fmt, kwargs
 
 
+@functools.lru_cache(maxsize=64)
+def _fixed_list_item_format(num_items, selected):
+    '''
+    Return the format string FixedListSelection uses for its items.
+
+    This only depends on the number of items, so it is computed once rather
+    than for every item on every redraw.  (Looking it up by the number of
+    items means callers can still modify the items list directly.)
+    '''
+    num_width = len(str(num_items))
+    fmt = '{idx:red:>%d} {item}' % (num_width,)
+    if selected:
+        fmt = '{+:reverse}' + fmt
+    return fmt
+
+
 class Pager(Drawable):
     def __init__(self, region):
         super(Pager, self).__init__(region)
@@ -16,6 +16,8 @@ URL_PATTERN = ('(?:http|https|ftp)://[^ <>"\t\n\r\f]*|'
                '[-a-zA-Z0-9._]+\.(?:com|net|org|gov)(?:/[^ <>"\t\n\r\f]*|\\b)')
 URL_RE = re.compile(URL_PATTERN)
 
+_FB_LINK_SHIM_RE = re.compile(r'^/l/([a-zA-Z0-9_\-.]*)(?:;|/)(?P<url>.*)')
+
 
 class URL:
     def __init__(self, url, label=None):
@@ -104,23 +106,28 @@ class URL:
         if not next_path.startswith('/'):
             next_path = '/' + next_path
 
-        next_params = urllib.parse.parse_qs(url_obj.query)
-        next_fragment = next_params.get('fragment', '')
+        # Build the parameter dictionary from the pairs we already parsed,
+        # rather than parsing the query string a second time with parse_qs().
+        # (Like parse_qs(), this drops parameters with blank values.)
+        next_params = {}
+        for name, value in qparams:
+            if value:
+                next_params.setdefault(name, []).append(value)
+        next_fragment = next_params.get('fragment', [''])[0]
 
         # Strip parameters that aren't passed on to the next URL
         for param in ['bcode', 'lloc', 'mid', 'd', 'n_m', 'aref', 'fragment']:
             if param in next_params:
                 del next_params[param]
 
-        next_query = urllib.parse.urlencode(next_params)
+        next_query = urllib.parse.urlencode(next_params, doseq=True)
         next_url = urllib.parse.ParseResult(url_obj.scheme, url_obj.netloc,
                                             next_path, url_obj.params,
                                             next_query, next_fragment)
         return next_url
 
     def demangle_fb_link_shim(self, url_obj):
-        r = re.compile('^/l/([a-zA-Z0-9\_\-\.]*)(?:;|/)(?P<url>.*)')
-        m = r.match(url_obj.path)
+        m = _FB_LINK_SHIM_RE.match(url_obj.path)
         if not m:
             return None
 
@@ -147,6 +154,25 @@ class URL:
         return urllib.parse.urlparse(next_url_str)
 
 
+def _make_urls(links):
+    '''
+    Create URL objects for a list of (url, label) tuples.
+
+    Messages often contain the same link many times (for instance in mailing
+    list footers), so repeated links share a single URL object.  Each
+    distinct link is then only parsed and demangled once.
+    '''
+    known_urls = {}
+    urls = []
+    for link in links:
+        url = known_urls.get(link)
+        if url is None:
+            url = URL(*link)
+            known_urls[link] = url
+        urls.append(url)
+    return urls
+
+
 def get_urls(msg):
     payload = message.decode_payload(msg)
     if msg.get_content_type() == 'text/html':
@@ -155,12 +181,16 @@ def get_urls(msg):
 
 
 def _html_text_contents(elem, results):
-    if isinstance(elem, str):
-        results.append(elem)
-        return
-
-    for child in elem.contents:
-        _html_text_contents(child, results)
+    # Walk the tree with an explicit stack rather than recursing.  This avoids
+    # a function call per node, and deeply nested markup can't hit the
+    # recursion limit.
+    stack = [elem]
+    while stack:
+        elem = stack.pop()
+        if isinstance(elem, str):
+            results.append(elem)
+        else:
+            stack.extend(reversed(elem.contents))
 
 
 def get_urls_html(payload):
@@ -169,7 +199,7 @@ def get_urls_html(payload):
     # (like a table inside an anchor).
     soup = bs4.BeautifulSoup(payload, 'html5lib')
 
-    urls = []
+    links = []
     for tag in soup.find_all('a'):
         url_text = tag.get('href')
         if url_text is None:
@@ -177,8 +207,7 @@ def get_urls_html(payload):
 
         # Join all of the text underneath this anchor to construct the label.
         results = []
-        for elem in tag.contents:
-            _html_text_contents(elem, results)
+        _html_text_contents(tag, results)
         if not results:
             value = None
         else:
@@ -189,14 +218,14 @@ def get_urls_html(payload):
             # Replace all non-breaking space characters with spaces.
             value = value.replace('\N{NO-BREAK SPACE}', ' ')
 
-        urls.append(URL(url_text, value))
+        links.append((url_text, value))
 
-    return urls
+    return _make_urls(links)
 
 
 def get_urls_text(payload):
     matches = URL_RE.findall(payload)
-    return [URL(url_text) for url_text in matches]
+    return _make_urls([(url_text, None) for url_text in matches])
 
 
 def extract_urls_generic(msg):
@@ -327,11 +356,14 @@ def select_urls(amt_config, urls):
         # Reset stdin to be our controlling terminal
         os.dup2(sys.stdout.fileno(), sys.stdin.fileno())
         term = Terminal()
-        with term.program_mode() as root:
-            try:
-                url = select_urls_term(amt_config, urls, root)
-            except KeyboardInterrupt:
-                url = None
+        try:
+            with term.program_mode() as root:
+                try:
+                    url = select_urls_term(amt_config, urls, root)
+                except KeyboardInterrupt:
+                    url = None
+        finally:
+            term.close()
         if url is not None:
             view_url(amt_config, url)
     else:
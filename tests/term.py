@@ -0,0 +1,257 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright (c) 2012, Adam Simpkins
+#
+import os
+import pty
+import signal
+import threading
+import tty
+import unittest
+
+from amt.term import format
+from amt.term import keys
+from amt.term import unicode
+from amt.term.attr import Attributes
+
+
+def _make_escape_table():
+    # Build the table by hand, rather than looking up the key capabilities,
+    # so the tests don't depend on the terminfo database.
+    escape_table = keys.EscapeTable()
+    escape_table.add_key(b'\x1bOA', keys.KEY_UP)
+    escape_table.add_key(b'\x1bOB', keys.KEY_DOWN)
+    escape_table.add_key(b'\x1b[5~', keys.KEY_PPAGE)
+    escape_table.add_key(b'\x1b[6~', keys.KEY_NPAGE)
+    return escape_table
+
+
+class _Timeout(Exception):
+    pass
+
+
+class TermInputTests(unittest.TestCase):
+    def setUp(self):
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        # Use a small read buffer, so tests can easily fill it.  (A pty
+        # never returns more than 4095 bytes from a single read.)
+        self.input = keys.TermInput(self.slave_fd,
+                                    escape_table=_make_escape_table(),
+                                    read_bufsize=16)
+
+    def tearDown(self):
+        self.input.close()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def getch(self, escape_time=None, timeout=2):
+        # Fail rather than hanging forever if getch() blocks
+        def _alarm(signum, frame):
+            raise _Timeout()
+
+        old_handler = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return self.input.getch(escape_time)
+        except _Timeout:
+            self.fail('getch() blocked for more than %s seconds' % timeout)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+
+    def write_later(self, data, delay=0.01):
+        timer = threading.Timer(delay, os.write, (self.master_fd, data))
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_ascii(self):
+        os.write(self.master_fd, b'ab\r')
+        self.assertEqual(self.getch(), 'a')
+        self.assertEqual(self.getch(), 'b')
+        self.assertEqual(self.getch(), '\r')
+
+    def test_escape_seq(self):
+        os.write(self.master_fd, b'x\x1bOA\x1b[6~y')
+        self.assertEqual(self.getch(), 'x')
+        self.assertIs(self.getch(), keys.KEY_UP)
+        self.assertIs(self.getch(), keys.KEY_NPAGE)
+        self.assertEqual(self.getch(), 'y')
+
+    def test_paste(self):
+        # More input than fits in the read buffer
+        text = 'The quick brown fox \x1bOAjumps over the lazy dog' * 4
+        os.write(self.master_fd, text.encode('utf-8'))
+        expected = text.replace('\x1bOA', '\x1b')
+        result = [self.getch() for _ in expected]
+        self.assertEqual(result.count(keys.KEY_UP), 4)
+        result = ['\x1b' if ch is keys.KEY_UP else ch for ch in result]
+        self.assertEqual(''.join(result), expected)
+
+    def test_utf8(self):
+        text = 'aé中\U0001f600b'
+        os.write(self.master_fd, text.encode('utf-8'))
+        self.assertEqual([self.getch() for _ in text], list(text))
+
+    def test_split_utf8(self):
+        data = '中'.encode('utf-8')
+        os.write(self.master_fd, data[:1])
+        self.write_later(data[1:])
+        self.assertEqual(self.getch(escape_time=1), '中')
+
+    def test_invalid_utf8(self):
+        # A lead byte followed by a non-continuation byte is returned on its
+        # own, without swallowing the next character.
+        os.write(self.master_fd, b'\xe4a')
+        self.assertEqual(self.getch(), '\udce4')
+        self.assertEqual(self.getch(), 'a')
+
+    def test_split_escape_seq(self):
+        os.write(self.master_fd, b'\x1b')
+        self.write_later(b'OA')
+        self.assertIs(self.getch(escape_time=1), keys.KEY_UP)
+
+    def test_escape_timeout(self):
+        # A lone escape is returned once the escape time expires
+        os.write(self.master_fd, b'\x1b')
+        self.assertEqual(self.getch(escape_time=0.01), '\x1b')
+
+        # As is the start of an incomplete escape sequence
+        os.write(self.master_fd, b'\x1bO')
+        self.assertEqual(self.getch(escape_time=0.01), '\x1b')
+        self.assertEqual(self.getch(escape_time=0.01), 'O')
+
+    def test_unknown_escape_seq(self):
+        os.write(self.master_fd, b'\x1bOz')
+        self.assertEqual(self.getch(), '\x1b')
+        self.assertEqual(self.getch(), 'O')
+        self.assertEqual(self.getch(), 'z')
+
+    def test_resize(self):
+        resizes = []
+        self.input.on_resize = lambda: resizes.append(True)
+
+        self.input.signal_resize()
+        self.input.signal_resize()
+        os.write(self.master_fd, b'a')
+        self.assertEqual(self.getch(), 'a')
+        self.assertEqual(resizes, [True])
+
+    def test_resize_while_waiting(self):
+        resizes = []
+        self.input.on_resize = lambda: resizes.append(True)
+
+        timer = threading.Timer(0.01, self.input.signal_resize)
+        timer.start()
+        self.addCleanup(timer.join)
+        self.write_later(b'a', delay=0.05)
+        self.assertEqual(self.getch(), 'a')
+        self.assertEqual(resizes, [True])
+
+    def test_resize_after_full_read(self):
+        # Fill the read buffer exactly, with a resize pending.  The pending
+        # resize must not make getch() block trying to read more input.
+        data = b'x' * self.input.read_bufsize
+        os.write(self.master_fd, data)
+        self.input.signal_resize()
+        self.assertEqual(self.getch(), 'x')
+        rest = ''.join(self.getch() for _ in range(len(data) - 1))
+        self.assertEqual(rest, 'x' * (len(data) - 1))
+
+
+class EscapeTableTests(unittest.TestCase):
+    def test_table_size(self):
+        escape_table = _make_escape_table()
+        # Each state has exactly one 256-entry row of transitions
+        self.assertEqual(len(escape_table.transitions),
+                         256 * len(escape_table.accept))
+        self.assertIn(0x1b, escape_table)
+        self.assertNotIn(ord('O'), escape_table)
+
+
+class _FakeTerm:
+    def __init__(self):
+        self.default_attr = Attributes()
+
+
+class UnicodeTests(unittest.TestCase):
+    def setUp(self):
+        if unicode.renderable_line('中')[1] != 2:
+            self.skipTest('the current locale does not support wide '
+                          'characters')
+
+    def test_plain(self):
+        self.assertEqual(unicode.renderable_line('abc'), ('abc', 3))
+        self.assertEqual(unicode.renderable_line('abcdef', max_width=4),
+                         ('abcd', 4))
+
+    def test_line_end(self):
+        self.assertEqual(unicode.renderable_line('ab\ncd'), ('ab', 2))
+        self.assertEqual(unicode.renderable_line('a中 cd'),
+                         ('a中', 3))
+
+    def test_control_chars(self):
+        self.assertEqual(unicode.renderable_line('a\x01b\x7f'), ('ab', 2))
+
+    def test_tabs(self):
+        self.assertEqual(unicode.renderable_line('a\tb'), ('a       b', 9))
+        self.assertEqual(unicode.renderable_line('ab\tc', tab_stop=4),
+                         ('ab  c', 5))
+        self.assertEqual(unicode.renderable_line('中\tc', tab_stop=4),
+                         ('中  c', 5))
+
+    def test_tabs_max_width(self):
+        # A tab never expands past max_width
+        self.assertEqual(unicode.renderable_line('a\tb', max_width=4),
+                         ('a   ', 4))
+        self.assertEqual(unicode.renderable_line('abcdefghij\tb',
+                                                 max_width=12),
+                         ('abcdefghij  ', 12))
+        self.assertEqual(unicode.renderable_line('a\tbc', max_width=10),
+                         ('a       bc', 10))
+
+    def test_wide_max_width(self):
+        # Wide characters that don't fit are dropped, not split
+        self.assertEqual(unicode.renderable_line('中中',
+                                                 max_width=3),
+                         ('中', 2))
+        self.assertEqual(unicode.truncate_line('a中b', 2), 'a')
+
+
+class FormatTests(unittest.TestCase):
+    def setUp(self):
+        if unicode.renderable_line('中')[1] != 2:
+            self.skipTest('the current locale does not support wide '
+                          'characters')
+        self.term = _FakeTerm()
+
+    def vformat(self, fmt, *args, **kwargs):
+        return format.vformat(self.term, fmt, args, {}, **kwargs)
+
+    def test_hfill(self):
+        self.assertEqual(self.vformat('ab', width=5, hfill=True), 'ab   ')
+        self.assertEqual(self.vformat('{0}', 'ab', width=5, hfill='.'),
+                         'ab...')
+        self.assertEqual(self.vformat('{0}', 'ab', width=5), 'ab')
+
+    def test_wide_hfill(self):
+        for fmt, args in (('ab', ()), ('{0}', ('ab',))):
+            # The padding divides evenly into the remaining width
+            self.assertEqual(self.vformat(fmt, *args, width=6,
+                                          hfill='中'),
+                             'ab中中')
+            # Half a wide character doesn't fit, so it is left off
+            self.assertEqual(self.vformat(fmt, *args, width=7,
+                                          hfill='中'),
+                             'ab中中')
+
+    def test_multi_char_hfill(self):
+        self.assertEqual(self.vformat('{0}', 'ab', width=6, hfill='-='),
+                         'ab-=-=')
+        self.assertEqual(self.vformat('{0}', 'ab', width=7, hfill='-='),
+                         'ab-=-=-')
+        self.assertEqual(self.vformat('ab', width=7, hfill='-='), 'ab-=-=-')
+
+    def test_truncate(self):
+        self.assertEqual(self.vformat('abcdef', width=4, hfill=True), 'abcd')
+        self.assertEqual(self.vformat('{0}', 'abcdef', width=4), 'abcd')
@@ -0,0 +1,64 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright (c) 2013, Adam Simpkins
+#
+import unittest
+import urllib.parse
+
+try:
+    from amt import urlview
+except ImportError:
+    # amt.urlview requires BeautifulSoup
+    urlview = None
+
+
+@unittest.skipIf(urlview is None, 'amt.urlview could not be imported')
+class Tests(unittest.TestCase):
+    def test_repeated_urls(self):
+        payload = ('See http://example.com/a and http://example.com/b\n'
+                   'Unsubscribe: http://example.com/a\n')
+        urls = urlview.get_urls_text(payload)
+        self.assertEqual([str(url) for url in urls],
+                         ['http://example.com/a', 'http://example.com/b',
+                          'http://example.com/a'])
+        # Repeated links share one URL object
+        self.assertIs(urls[0], urls[2])
+        self.assertIsNot(urls[0], urls[1])
+
+    def demangle_fb_notification_shim(self, url):
+        url_obj = urllib.parse.urlparse(url)
+        result = urlview.URL(url).demangle_fb_notification_shim(url_obj)
+        if result is None:
+            return None
+        return urllib.parse.urlunparse(result)
+
+    def test_fb_notification_shim(self):
+        url = ('https://www.facebook.com/n/?permalink.php'
+               '&story_fbid=123&id=5&mid=abc&bcode=1.2&n_m=bob%40example.com'
+               '&lloc=comment&aref=7&fragment=comments')
+        self.assertEqual(self.demangle_fb_notification_shim(url),
+                         'https://www.facebook.com/permalink.php'
+                         '?story_fbid=123&id=5#comments')
+
+    def test_fb_notification_shim_no_fragment(self):
+        url = 'https://www.facebook.com/n/?groups%2F42%2F&view=permalink&d=x'
+        self.assertEqual(self.demangle_fb_notification_shim(url),
+                         'https://www.facebook.com/groups/42/?view=permalink')
+
+    def test_fb_notification_shim_repeated_param(self):
+        url = 'https://www.facebook.com/n/?photo.php&set=a&set=b&empty='
+        self.assertEqual(self.demangle_fb_notification_shim(url),
+                         'https://www.facebook.com/photo.php?set=a&set=b')
+
+    def test_fb_notification_shim_invalid(self):
+        # Old style link shims, that don't start with the next path
+        self.assertIsNone(self.demangle_fb_notification_shim(
+            'https://www.facebook.com/n/'))
+        self.assertIsNone(self.demangle_fb_notification_shim(
+            'https://www.facebook.com/n/?id=5&mid=abc'))
+
+    def test_demangle(self):
+        url = urlview.URL('https://www.facebook.com/n/?profile.php&id=5'
+                          '&mid=abc')
+        self.assertEqual(url.get_display_url(None),
+                         'https://www.facebook.com/profile.php?id=5')